@@ -16,26 +16,54 @@ Example:
 Requirements:
     - Python 3.x
     - pandas
-    - openpyxl (for writing XLSX files)
+    - xlsxwriter (for writing XLSX files)
     - biopython (for accessing Bio.Entrez)
+    - lxml (for fast streaming XML parsing)
+    - requests (for pooled, keep-alive HTTP to the E-utilities endpoints)
     - tqdm (for progress bar and ETA)
-    - pip install pandas openpyxl biopython tqdm
+    - orjson (optional, for faster JSON parsing of ESummary responses)
+    - pip install pandas xlsxwriter biopython lxml requests tqdm
 
 Output:
     - institution_publications_metadata.csv
-    - institution_publications_metadata.xlsx
+    - institution_publications_metadata.xlsx (only with --xlsx)
 """
 
+import argparse
+import csv
+import functools
+import math
+import re
+import sqlite3
 import sys
 import logging
+import threading
 import time
 import pandas as pd
 import os
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from lxml import etree
+from requests.adapters import HTTPAdapter
 from tqdm import tqdm
+from urllib3.util.retry import Retry
 from Bio import Entrez
 from Bio.Entrez import HTTPError
 
+# The per-article parse/format hot path lives in its own module so it can
+# optionally be AOT-compiled with mypyc (see pubmed_parse.py).
+from pubmed_parse import parse_article, parse_article_element, summary_to_row
+
+# orjson (C-implemented) parses ESummary payloads several times faster than
+# stdlib json into plain dicts; fall back to stdlib if it is not installed.
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    from json import loads as _json_loads
+
 # Configure logging
 logging.basicConfig(
     level=logging.DEBUG,
@@ -43,6 +71,252 @@ logging.basicConfig(
     datefmt="%Y-%m-%d %H:%M:%S"
 )
 
+# Number of PubMed IDs fetched per EPost+EFetch round-trip.
+BATCH_SIZE = 200
+
+# Column order shared by the CSV writer and the metadata dictionaries.
+CSV_FIELDS = ["PubMed_ID", "Title", "Authors", "Journal", "Year"]
+
+# ID classification patterns: typical PMIDs, overlong numerics, PMC accessions.
+_PMID_RE = re.compile(r"^\d{1,8}$")
+_LONG_PMID_RE = re.compile(r"^\d{9,}$")
+_PMC_RE = re.compile(r"^PMC\d+$", re.IGNORECASE)
+
+# Maximum number of worker threads for concurrent batch fetches.
+MAX_WORKERS = 8
+
+EFETCH_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
+ESUMMARY_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esummary.fcgi"
+
+# On-disk cache of previously fetched metadata, so re-runs over overlapping
+# ID lists skip the network entirely for known PMIDs.
+CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "pubmed_meta.sqlite")
+
+# Number of placeholders per cache SELECT (SQLite caps bound parameters).
+_CACHE_CHUNK = 500
+
+# Persistent session so batch requests reuse one TCP+TLS connection per
+# worker instead of paying the handshake on every call. urllib3's Retry
+# transparently retries rate-limit and server errors.
+SESSION = requests.Session()
+# Ask NCBI to gzip response bodies (~6-8x smaller for PubmedArticle XML);
+# requests decompresses transparently, including on streamed raw reads.
+SESSION.headers["Accept-Encoding"] = "gzip, deflate"
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=MAX_WORKERS * 2,
+    pool_maxsize=MAX_WORKERS * 2,
+    max_retries=Retry(
+        total=5,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        # E-utilities requests are idempotent reads even over POST (we only
+        # POST to fit large ID lists); without this, urllib3's default
+        # allowed_methods would exempt POSTs from the retry policy.
+        allowed_methods=None
+    )
+))
+
+# Requests per second allowed by NCBI: 3 without an API key, 10 with one.
+# Updated by _configure_entrez() once the environment has been inspected.
+_REQUEST_RATE = 3.0
+
+# Sliding one-second window of request timestamps, shared across threads.
+_request_lock = threading.Lock()
+_request_times = deque()
+
+def _acquire_request_slot() -> None:
+    """
+    Block the calling thread until a request can be issued without
+    exceeding _REQUEST_RATE requests in any one-second window.
+    """
+    while True:
+        with _request_lock:
+            now = time.monotonic()
+            while _request_times and now - _request_times[0] >= 1.0:
+                _request_times.popleft()
+            if len(_request_times) < _REQUEST_RATE:
+                _request_times.append(now)
+                return
+            wait = 1.0 - (now - _request_times[0])
+        time.sleep(max(wait, 0.0))
+
+def _configure_entrez() -> None:
+    """
+    Configure Entrez credentials once from the environment.
+
+    Reads the contact email from NCBI_EMAIL and, if NCBI_API_KEY is set,
+    registers the API key with Entrez and raises the request rate from
+    3 to 10 requests per second (NCBI's documented limits).
+    """
+    global _REQUEST_RATE
+    Entrez.email = os.environ.get("NCBI_EMAIL", "test@example.com")
+    api_key = os.environ.get("NCBI_API_KEY")
+    if api_key:
+        Entrez.api_key = api_key
+        _REQUEST_RATE = 10.0
+        logging.info("Using NCBI API key from NCBI_API_KEY (10 requests/second).")
+    else:
+        logging.info("No NCBI_API_KEY set; limited to 3 requests/second.")
+
+# Configure once at import time; every code path (main, --debug, library
+# use) sees the same credentials without re-assigning module globals.
+_configure_entrez()
+
+def rate_limited(func):
+    """
+    Decorator that spaces calls to the wrapped function so they stay under
+    _REQUEST_RATE requests per second, and retries HTTP 429 (rate limit)
+    responses with exponential backoff (2, 4, 8 seconds).
+
+    Handles both urllib's HTTPError (raised by the Bio.Entrez wrappers)
+    and requests.HTTPError (raised by the session calls' raise_for_status
+    once the transport-level Retry is exhausted).
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        for backoff in (2, 4, 8, None):
+            _acquire_request_slot()
+            try:
+                return func(*args, **kwargs)
+            except (HTTPError, requests.HTTPError) as e:
+                status = getattr(e, "code", None)
+                if status is None and getattr(e, "response", None) is not None:
+                    status = e.response.status_code
+                if status == 429 and backoff is not None:
+                    logging.warning(f"HTTP 429 from NCBI; retrying in {backoff}s.")
+                    time.sleep(backoff)
+                    continue
+                raise
+    return wrapper
+
+@rate_limited
+def _entrez_efetch(**kwargs):
+    return Entrez.efetch(**kwargs)
+
+@rate_limited
+def _entrez_esearch(**kwargs):
+    return Entrez.esearch(**kwargs)
+
+@rate_limited
+def _entrez_elink(**kwargs):
+    return Entrez.elink(**kwargs)
+
+@rate_limited
+def _efetch_batch(pmid_batch: list):
+    """
+    POST a batch of PubMed IDs directly to the EFetch endpoint over the
+    shared keep-alive session, returning a streaming response.
+    """
+    params = {
+        "db": "pubmed",
+        "id": ",".join(pmid_batch),
+        "rettype": "xml",
+        "retmode": "xml",
+        "email": Entrez.email,
+        "tool": Entrez.tool
+    }
+    api_key = getattr(Entrez, "api_key", None)
+    if api_key:
+        params["api_key"] = api_key
+    resp = SESSION.post(EFETCH_URL, data=params, stream=True, timeout=60)
+    resp.raise_for_status()
+    logging.debug(
+        f"EFetch batch of {len(pmid_batch)}: "
+        f"Content-Encoding={resp.headers.get('Content-Encoding', 'identity')}"
+    )
+    return resp
+
+@rate_limited
+def _esummary_batch(pmid_batch: list):
+    """
+    Request document summaries for a batch of PubMed IDs as JSON.
+
+    ESummary returns a small, pre-parsed payload with exactly the fields
+    we export, so it is much cheaper than a full PubmedArticle EFetch.
+    """
+    params = {
+        "db": "pubmed",
+        "id": ",".join(pmid_batch),
+        "retmode": "json",
+        "email": Entrez.email,
+        "tool": Entrez.tool
+    }
+    api_key = getattr(Entrez, "api_key", None)
+    if api_key:
+        params["api_key"] = api_key
+    resp = SESSION.post(ESUMMARY_URL, data=params, timeout=60)
+    resp.raise_for_status()
+    return resp
+
+def _open_cache(cache_path: str = CACHE_PATH) -> sqlite3.Connection:
+    """
+    Open (creating if necessary) the on-disk metadata cache.
+
+    :param cache_path: Path to the sqlite database file.
+    :return: An autocommit sqlite3 connection with the cache table ensured.
+    """
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    conn = sqlite3.connect(cache_path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS cache ("
+        "pmid TEXT PRIMARY KEY, title TEXT, authors TEXT, "
+        "journal TEXT, year TEXT, fetched_at REAL)"
+    )
+    return conn
+
+def _cache_lookup(conn: sqlite3.Connection, pmids: list, refresh_older_than=None) -> dict:
+    """
+    Look up PubMed IDs in the cache.
+
+    :param conn: Cache connection from _open_cache.
+    :param pmids: List of PubMed ID strings to look up.
+    :param refresh_older_than: If set, entries fetched more than this many
+        days ago are treated as misses so they get re-fetched.
+    :return: A dict mapping each cached pmid to its metadata dictionary.
+    """
+    cutoff = None
+    if refresh_older_than is not None:
+        cutoff = time.time() - refresh_older_than * 86400
+
+    hits = {}
+    for start in range(0, len(pmids), _CACHE_CHUNK):
+        chunk = pmids[start:start + _CACHE_CHUNK]
+        placeholders = ",".join("?" * len(chunk))
+        query = (
+            "SELECT pmid, title, authors, journal, year, fetched_at "
+            f"FROM cache WHERE pmid IN ({placeholders})"
+        )
+        for pmid, title, authors, journal, year, fetched_at in conn.execute(query, chunk):
+            if cutoff is not None and fetched_at < cutoff:
+                continue
+            hits[pmid] = {
+                "PubMed_ID": pmid,
+                "Title": title,
+                "Authors": authors,
+                "Journal": journal,
+                "Year": year
+            }
+    return hits
+
+def _cache_store(conn: sqlite3.Connection, rows: list) -> None:
+    """
+    Insert (or refresh) fetched metadata rows in the cache.
+
+    :param conn: Cache connection from _open_cache.
+    :param rows: Metadata dictionaries as produced by the fetchers.
+    """
+    now = time.time()
+    conn.executemany(
+        "INSERT OR REPLACE INTO cache (pmid, title, authors, journal, year, fetched_at) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (row["PubMed_ID"], row["Title"], row["Authors"], row["Journal"], row["Year"], now)
+            for row in rows
+        ]
+    )
+
 def test_pubmed_api() -> bool:
     """
     Test the PubMed API with a known working PubMed ID to verify the connection
@@ -54,10 +328,7 @@ def test_pubmed_api() -> bool:
     
     logging.info(f"Testing PubMed API with known valid ID: {test_id}")
     try:
-        # Entrez requires a valid email address
-        Entrez.email = "test@example.com"
-        
-        handle = Entrez.efetch(db="pubmed", id=test_id, rettype="xml", retmode="xml")
+        handle = _entrez_efetch(db="pubmed", id=test_id, rettype="xml", retmode="xml")
         records = Entrez.read(handle)
         handle.close()
         
@@ -83,10 +354,8 @@ def search_pubmed_id(search_term: str) -> str:
     :param search_term: The term to search for (DOI, PMC ID, title, etc.)
     :return: The first matching PubMed ID or None if no matches.
     """
-    Entrez.email = "test@example.com"
-    
     try:
-        handle = Entrez.esearch(db="pubmed", term=search_term, retmax=1)
+        handle = _entrez_esearch(db="pubmed", term=search_term, retmax=1)
         results = Entrez.read(handle)
         handle.close()
         
@@ -116,15 +385,13 @@ def fetch_pubmed_record(pmid: str) -> dict:
       If retrieval fails or metadata is incomplete, returns partial data
       or an empty dict.
     """
-    Entrez.email = "test@example.com"
-
     logging.debug(f"Making API request for PubMed ID: {pmid}")
     try:
         # Typical PubMed IDs are up to ~8 digits, so if the ID is longer, it may be invalid.
         if len(pmid) > 8 and pmid.isdigit():
             logging.warning(f"PubMed ID {pmid} is unusually long; it may not be valid.")
-        
-        handle = Entrez.efetch(db="pubmed", id=pmid, rettype="xml", retmode="xml")
+
+        handle = _entrez_efetch(db="pubmed", id=pmid, rettype="xml", retmode="xml")
         records = Entrez.read(handle)
         handle.close()
         
@@ -144,47 +411,7 @@ def fetch_pubmed_record(pmid: str) -> dict:
                 return fetch_pubmed_record(fallback_id)
             return {}
         
-        article_data = records["PubmedArticle"][0]
-        medline_citation = article_data.get("MedlineCitation", {})
-        article = medline_citation.get("Article", {})
-
-        # PubMed ID (usually the same as the input, but we can confirm from the record)
-        record_pmid = medline_citation.get("PMID", pmid)
-
-        # Title
-        title = article.get("ArticleTitle", "")
-
-        # Journal
-        journal_info = article.get("Journal", {})
-        journal_title = journal_info.get("Title", "")
-
-        # Authors (join ForeName + LastName)
-        author_list = []
-        authors = article.get("AuthorList", [])
-        for author in authors:
-            last_name = author.get("LastName", "")
-            fore_name = author.get("ForeName", "")
-            if last_name or fore_name:
-                author_list.append(f"{fore_name} {last_name}".strip())
-            elif "CollectiveName" in author:
-                author_list.append(author["CollectiveName"])
-        authors_str = ", ".join(author_list)
-
-        # Year (preferred from JournalIssue -> PubDate -> Year)
-        journal_issue = journal_info.get("JournalIssue", {})
-        pub_date = journal_issue.get("PubDate", {})
-        year = pub_date.get("Year", "")
-        if not year:
-            date_created = medline_citation.get("DateCreated", {})
-            year = date_created.get("Year", "")
-
-        return {
-            "PubMed_ID": str(record_pmid),
-            "Title": title,
-            "Authors": authors_str,
-            "Journal": journal_title,
-            "Year": year
-        }
+        return parse_article(records["PubmedArticle"][0], pmid)
 
     except HTTPError as e:
         logging.error(f"HTTPError while fetching PubMed ID {pmid}: {e}")
@@ -197,88 +424,238 @@ def fetch_pubmed_record(pmid: str) -> dict:
         logging.error(f"Unexpected error while fetching PubMed ID {pmid}: {e}")
         return {}
 
+def _fetch_batch_xml(pmid_batch: list) -> list:
+    """
+    Fetch metadata for a batch of PubMed IDs via EFetch XML.
+
+    The full ID list is POSTed to the EFetch endpoint over the shared
+    keep-alive session and the XML response is stream-parsed article by
+    article. Used as the fallback when ESummary lacks a record or field.
+
+    :param pmid_batch: A list of validated PubMed ID strings.
+    :return: A list of metadata dictionaries, one per successfully
+        retrieved article.
+    """
+    rows = []
+    try:
+        resp = _efetch_batch(pmid_batch)
+        # Stream-parse the XML rather than materializing the whole response
+        # with Entrez.read; clearing each element keeps memory flat.
+        resp.raw.decode_content = True
+        for _, elem in etree.iterparse(resp.raw, events=("end",), tag="PubmedArticle"):
+            metadata = parse_article_element(elem)
+            if metadata.get("PubMed_ID"):
+                rows.append(metadata)
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+        resp.close()
+    except requests.RequestException as e:
+        logging.error(f"HTTP error while fetching batch of {len(pmid_batch)} IDs: {e}")
+    except Exception as e:
+        logging.error(f"Unexpected error while fetching batch of {len(pmid_batch)} IDs: {e}")
+    return rows
+
+def _pmids_not_in_rows(pmid_batch: list, rows: list) -> list:
+    """
+    Return the PMIDs from pmid_batch that have no row yet, preserving order.
+
+    Used when a batch request fails partway through: only IDs that have not
+    already produced a row should be retried, so earlier successes are not
+    duplicated in the output.
+    """
+    seen = {row["PubMed_ID"] for row in rows}
+    return [pmid for pmid in pmid_batch if pmid not in seen]
+
+def fetch_pubmed_batch(pmid_batch: list) -> list:
+    """
+    Fetch metadata for a batch of PubMed IDs, preferring ESummary JSON.
+
+    ESummary returns all five exported fields in a payload roughly 5x
+    smaller than the PubmedArticle XML, with no XML parsing needed. IDs
+    whose summaries are missing or incomplete are re-fetched through the
+    EFetch XML path, and anything still absent falls back to the per-ID
+    fetch_pubmed_record path (which handles its own search fallback).
+
+    :param pmid_batch: A list of validated PubMed ID strings (at most
+        BATCH_SIZE entries).
+    :return: A list of metadata dictionaries, one per successfully
+        retrieved article.
+    """
+    rows = []
+    needs_xml = []
+    try:
+        resp = _esummary_batch(pmid_batch)
+        result = _json_loads(resp.content).get("result", {})
+        for pmid in pmid_batch:
+            doc = result.get(pmid)
+            if not doc or "error" in doc:
+                needs_xml.append(pmid)
+                continue
+            metadata = summary_to_row(pmid, doc)
+            if metadata["Title"] and metadata["Year"]:
+                rows.append(metadata)
+            else:
+                needs_xml.append(pmid)
+    except requests.RequestException as e:
+        logging.error(f"HTTP error while summarizing batch of {len(pmid_batch)} IDs: {e}")
+        needs_xml = _pmids_not_in_rows(pmid_batch, rows)
+    except Exception as e:
+        logging.error(f"Unexpected error while summarizing batch of {len(pmid_batch)} IDs: {e}")
+        needs_xml = _pmids_not_in_rows(pmid_batch, rows)
+
+    if needs_xml:
+        logging.debug(f"Falling back to EFetch XML for {len(needs_xml)} IDs.")
+        rows.extend(_fetch_batch_xml(needs_xml))
+
+    # Fall back to per-ID fetching for any IDs absent from the batch response.
+    missing = _pmids_not_in_rows(pmid_batch, rows)
+    for pmid in missing:
+        logging.debug(f"PubMed ID {pmid} missing from batch response; retrying individually.")
+        metadata = fetch_pubmed_record(pmid)
+        if metadata and "PubMed_ID" in metadata:
+            rows.append(metadata)
+
+    return rows
+
+def _convert_pmc_ids(pmc_ids: list) -> list:
+    """
+    Convert PMC accessions to PubMed IDs with a single elink request.
+
+    Submitting the numeric parts as separate ids returns one linkset per
+    accession, so the mapping (and the input order) is preserved while
+    still costing only one HTTP round-trip. Accessions elink cannot map
+    fall back to an individual search.
+
+    :param pmc_ids: A list of accession strings starting with "PMC".
+    :return: A list of converted PubMed ID strings, in input order.
+    """
+    numeric_ids = [pmc_id[3:] for pmc_id in pmc_ids]
+
+    mapped = {}
+    try:
+        handle = _entrez_elink(dbfrom="pmc", db="pubmed", id=numeric_ids)
+        linksets = Entrez.read(handle)
+        handle.close()
+        for linkset in linksets:
+            submitted = linkset.get("IdList", [None])[0]
+            linksetdbs = linkset.get("LinkSetDb", [])
+            if submitted and linksetdbs and linksetdbs[0].get("Link"):
+                mapped[str(submitted)] = str(linksetdbs[0]["Link"][0]["Id"])
+    except Exception as e:
+        logging.error(f"elink conversion of {len(pmc_ids)} PMC IDs failed: {e}")
+
+    converted = []
+    for pmc_id, numeric in zip(pmc_ids, numeric_ids):
+        pmid = mapped.get(numeric) or search_pubmed_id(pmc_id)
+        if pmid:
+            converted.append(pmid)
+        else:
+            logging.warning(f"Unable to convert {pmc_id} to PubMed ID.")
+    return converted
+
 def validate_pubmed_ids(ids_list) -> list:
     """
-    Validate a list of potential PubMed IDs to ensure they are in a correct numeric or PMC format.
+    Validate potential PubMed IDs to ensure they are in a correct numeric or PMC format.
     Also attempts conversion of PMC IDs to corresponding PubMed IDs if possible.
 
-    :param ids_list: A list of ID strings to validate.
+    :param ids_list: An iterable of ID strings to validate; consumed in a
+        single pass, so a lazy generator over a large file works fine.
     :return: A list of valid (and cleaned) PubMed IDs.
     """
     valid_ids = []
     pmc_ids_to_convert = []
-    
+    search_terms = []
+
+    # Single classification pass over all IDs; network lookups are deferred
+    # so they can run concurrently below.
     for raw_id in ids_list:
         candidate = raw_id.strip()
         if not candidate:
             continue
 
-        # Check if it is a PMC ID
-        if candidate.upper().startswith("PMC"):
+        if _PMID_RE.match(candidate):
+            valid_ids.append(candidate)
+        elif _PMC_RE.match(candidate):
             pmc_ids_to_convert.append(candidate)
-            continue
-
-        # If purely numeric, or possibly longer numeric that might still be valid
-        if candidate.isdigit():
-            # If it's a typical length (<=8 digits), accept it
-            if len(candidate) <= 8:
-                valid_ids.append(candidate)
-            else:
-                # Log and add it anyway, or attempt to take last 8 digits
-                logging.warning(f"ID {candidate} is longer than 8 digits. Attempting last 8.")
-                last_8 = candidate[-8:]
-                valid_ids.append(last_8)
+        elif _LONG_PMID_RE.match(candidate):
+            # Log and add it anyway, attempting the last 8 digits
+            logging.warning(f"ID {candidate} is longer than 8 digits. Attempting last 8.")
+            valid_ids.append(candidate[-8:])
         else:
-            # Not numeric, attempt to do a fallback search by the string
+            # Not numeric, attempt a fallback search by the string
             logging.warning(f"ID {candidate} is not a pure digit nor PMC, searching for match.")
-            fallback_id = search_pubmed_id(candidate)
-            if fallback_id:
-                valid_ids.append(fallback_id)
+            search_terms.append(candidate)
 
-    # Convert PMC IDs to PubMed IDs if possible
-    for pmc_id in pmc_ids_to_convert:
-        pmid = search_pubmed_id(pmc_id)
-        if pmid:
-            valid_ids.append(pmid)
-        else:
-            logging.warning(f"Unable to convert {pmc_id} to PubMed ID.")
+    # Resolve free-text/DOI entries concurrently; each search is a full
+    # network round-trip, so overlapping them matters for messy lists.
+    if search_terms:
+        max_workers = min(MAX_WORKERS, math.ceil(_REQUEST_RATE))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for fallback_id in executor.map(search_pubmed_id, search_terms):
+                if fallback_id:
+                    valid_ids.append(fallback_id)
+
+    # Convert PMC IDs to PubMed IDs in one elink round-trip
+    if pmc_ids_to_convert:
+        valid_ids.extend(_convert_pmc_ids(pmc_ids_to_convert))
 
     # Deduplicate while preserving order
     deduped = list(dict.fromkeys(valid_ids))
     return deduped
 
-def main(input_txtfile: str):
+def write_xlsx_fast(df: pd.DataFrame, path: str) -> None:
     """
-    Main execution function:
-      1. Test PubMed API connectivity.
-      2. Read PubMed IDs from the provided text file.
-      3. Validate and deduplicate the IDs (including PMC conversions, if any).
-      4. Fetch metadata for each ID, tracking progress via tqdm and periodic logging.
-      5. Export results as both CSV and XLSX in the same directory as the input text file.
-    """
-    # 1. Test PubMed API
-    if not test_pubmed_api():
-        logging.error("Failed to connect to PubMed API. Please check your internet connection.")
-        sys.exit(1)
+    Write a DataFrame to XLSX using the xlsxwriter engine.
 
-    # 2. Read lines from the input text file
+    xlsxwriter streams XML with far less per-cell overhead than openpyxl.
+    constant_memory mode is deliberately not used: it discards writes to
+    already-flushed rows, and pandas emits cells column-by-column, which
+    would silently drop most of the sheet.
+
+    :param df: The DataFrame to write.
+    :param path: Destination .xlsx file path.
+    """
+    with pd.ExcelWriter(path, engine="xlsxwriter") as writer:
+        df.to_excel(writer, sheet_name="metadata", index=False)
+
+def main(input_txtfile: str, use_cache: bool = True, refresh_older_than=None,
+         write_xlsx: bool = False):
+    """
+    Main execution function:
+      1. Read PubMed IDs from the provided text file.
+      2. Validate and deduplicate the IDs (including PMC conversions, if any).
+      3. Load cached metadata, then fetch the remaining IDs in batches,
+         tracking progress via tqdm and periodic logging.
+      4. Export results as CSV (and optionally XLSX) in the same directory
+         as the input text file.
+
+    API connectivity is not pre-flight tested; if every fetch fails, a
+    single diagnostic test fetch runs before exiting.
+
+    :param input_txtfile: Path to the text file of PubMed IDs (one per line).
+    :param use_cache: Whether to consult/update the on-disk sqlite cache.
+    :param refresh_older_than: Optional age in days past which cached
+        entries are re-fetched.
+    :param write_xlsx: Whether to also write an XLSX copy of the output;
+        XLSX writing dominates run time on large lists, so it is opt-in.
+    """
+    # 1. Read lines from the input text file
     if not os.path.exists(input_txtfile):
         logging.error(f"Input file not found: {input_txtfile}")
         sys.exit(1)
 
     try:
-        with open(input_txtfile, 'r') as f:
-            pubmed_ids_raw = [line.strip() for line in f if line.strip()]
-    except Exception as e:
+        f = open(input_txtfile, 'r')
+    except OSError as e:
         logging.error(f"Error reading input text file '{input_txtfile}': {e}")
         sys.exit(1)
 
-    if not pubmed_ids_raw:
-        logging.warning("No PubMed IDs found in the provided text file.")
-        sys.exit(0)
-
-    # 3. Validate and deduplicate IDs
-    pubmed_ids_cleaned = validate_pubmed_ids(pubmed_ids_raw)
+    # 2. Validate and deduplicate IDs, streaming lines through validation
+    # rather than materializing the whole file in memory first.
+    with f:
+        ids_iter = (line.strip() for line in f if line.strip())
+        pubmed_ids_cleaned = validate_pubmed_ids(ids_iter)
 
     if not pubmed_ids_cleaned:
         logging.warning("No valid PubMed IDs after validation/conversion.")
@@ -286,47 +663,126 @@ def main(input_txtfile: str):
 
     logging.info(f"Found {len(pubmed_ids_cleaned)} unique valid PubMed IDs to fetch.")
 
-    # 4. Fetch metadata with progress tracking
-    rows = []
+    # Output paths live next to the input text file.
+    input_dir = os.path.dirname(os.path.abspath(input_txtfile))
+    output_csv = os.path.join(input_dir, "institution_publications_metadata.csv")
+    output_xlsx = os.path.join(input_dir, "institution_publications_metadata.xlsx")
+
+    # 3. Serve what we can from the cache, then fetch the rest with progress
+    # tracking. Rows stream straight into the CSV as they arrive, so memory
+    # stays flat and an interrupted run still leaves partial results behind.
+    csv_fh = open(output_csv, "w", newline="")
+    writer = csv.DictWriter(csv_fh, fieldnames=CSV_FIELDS)
+    writer.writeheader()
+    unflushed = 0
+
+    cache_conn = None
+    ids_to_fetch = pubmed_ids_cleaned
     success_count = 0
+    if use_cache:
+        cache_conn = _open_cache()
+        cached = _cache_lookup(cache_conn, pubmed_ids_cleaned, refresh_older_than)
+        if cached:
+            writer.writerows(cached.values())
+            csv_fh.flush()
+            success_count = len(cached)
+            ids_to_fetch = [pmid for pmid in pubmed_ids_cleaned if pmid not in cached]
+            logging.info(
+                f"Loaded {len(cached)} records from cache; "
+                f"{len(ids_to_fetch)} remain to fetch from NCBI."
+            )
+
     fail_count = 0
     last_print_time = time.time()
 
-    for pmid in tqdm(pubmed_ids_cleaned, desc="Fetching PubMed metadata", unit="ID"):
-        metadata = fetch_pubmed_record(pmid)
-        if metadata and "PubMed_ID" in metadata:
-            rows.append(metadata)
-            success_count += 1
-        else:
-            fail_count += 1
-
-        # Periodically print how many have succeeded/failed
-        if (time.time() - last_print_time) >= 10:
-            logging.info(f"{success_count} records found, {fail_count} not found so far.")
-            last_print_time = time.time()
-
-    if not rows:
+    batches = [
+        ids_to_fetch[start:start + BATCH_SIZE]
+        for start in range(0, len(ids_to_fetch), BATCH_SIZE)
+    ]
+    # The work is entirely network-bound, so threads overlap HTTP latency;
+    # the shared rate limiter keeps aggregate throughput under NCBI's cap.
+    max_workers = min(MAX_WORKERS, math.ceil(_REQUEST_RATE))
+
+    progress = tqdm(total=len(ids_to_fetch), desc="Fetching PubMed metadata", unit="ID")
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for batch, batch_rows in zip(batches, executor.map(fetch_pubmed_batch, batches)):
+            if batch_rows:
+                writer.writerows(batch_rows)
+                unflushed += len(batch_rows)
+                if unflushed >= 100:
+                    csv_fh.flush()
+                    unflushed = 0
+            if cache_conn is not None and batch_rows:
+                _cache_store(cache_conn, batch_rows)
+            success_count += len(batch_rows)
+            fail_count += max(0, len(batch) - len(batch_rows))
+            progress.update(len(batch))
+
+            # Periodically print how many have succeeded/failed
+            if (time.time() - last_print_time) >= 10:
+                logging.info(f"{success_count} records found, {fail_count} not found so far.")
+                last_print_time = time.time()
+    progress.close()
+
+    if cache_conn is not None:
+        cache_conn.close()
+    csv_fh.close()
+
+    if success_count == 0:
         logging.warning("No valid metadata could be retrieved. Exiting.")
+        # Diagnose lazily: only hit the known-good test ID once real fetches
+        # have failed, rather than spending a round-trip on every startup.
+        if ids_to_fetch and not test_pubmed_api():
+            logging.error("Failed to connect to PubMed API. Please check your internet connection.")
+            sys.exit(1)
         sys.exit(0)
 
-    df_result = pd.DataFrame(rows, columns=["PubMed_ID", "Title", "Authors", "Journal", "Year"])
-    logging.info(f"Successfully retrieved metadata for {len(df_result)} articles.")
-
-    # 5. Write output to CSV and XLSX in the same directory as the input text file
-    input_dir = os.path.dirname(os.path.abspath(input_txtfile))
-    output_csv = os.path.join(input_dir, "institution_publications_metadata.csv")
-    output_xlsx = os.path.join(input_dir, "institution_publications_metadata.xlsx")
+    logging.info(f"Successfully retrieved metadata for {success_count} articles.")
+    logging.info(f"Exported metadata to: {output_csv}")
 
-    df_result.to_csv(output_csv, index=False)
-    df_result.to_excel(output_xlsx, index=False)
+    # 4. Optionally convert the finished CSV to XLSX
+    if write_xlsx:
+        df_result = pd.read_csv(output_csv, dtype=str, keep_default_na=False)
+        write_xlsx_fast(df_result, output_xlsx)
+        logging.info(f"Exported metadata to: {output_xlsx}")
+    else:
+        logging.info("Skipping XLSX output (pass --xlsx to enable).")
 
-    logging.info(f"Exported metadata to: {output_csv}")
-    logging.info(f"Exported metadata to: {output_xlsx}")
     logging.info("Done.")
 
+def _parse_args(argv=None) -> argparse.Namespace:
+    """
+    Parse command-line arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description="Fetch PubMed metadata for a list of IDs and export CSV/XLSX."
+    )
+    parser.add_argument(
+        "input_txtfile", nargs="?",
+        help="Path to a text file with one PubMed ID per line."
+    )
+    parser.add_argument(
+        "--debug", action="store_true",
+        help="Run a single test fetch against a known PubMed ID and exit."
+    )
+    parser.add_argument(
+        "--xlsx", action="store_true",
+        help="Also write an XLSX copy of the output (slower; CSV is always written)."
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true",
+        help="Skip the on-disk metadata cache and always hit NCBI."
+    )
+    parser.add_argument(
+        "--refresh-older-than", type=int, metavar="DAYS", default=None,
+        help="Re-fetch cached entries older than DAYS days."
+    )
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
-    # Check for debug mode
-    if len(sys.argv) > 1 and sys.argv[1] == "--debug":
+    args = _parse_args()
+
+    if args.debug:
         logging.info("Running in debug mode with test PubMed ID.")
         if not test_pubmed_api():
             logging.error("PubMed API test failed. Check your configuration/internet.")
@@ -340,10 +796,14 @@ if __name__ == "__main__":
             logging.error(f"Fetch failed for ID: {test_id}")
         sys.exit(0)
 
-    if len(sys.argv) != 2:
-        print("Usage: python fetch_pubmed_metadata.py <path_to_pubmed_ids_txt>")
-        print("       python fetch_pubmed_metadata.py --debug (to run in debug mode)")
+    if not args.input_txtfile:
+        print("Usage: python pubmed_meta_fetcher.py <path_to_pubmed_ids_txt>")
+        print("       python pubmed_meta_fetcher.py --debug (to run in debug mode)")
         sys.exit(1)
 
-    input_file_path = sys.argv[1]
-    main(input_file_path)
\ No newline at end of file
+    main(
+        args.input_txtfile,
+        use_cache=not args.no_cache,
+        refresh_older_than=args.refresh_older_than,
+        write_xlsx=args.xlsx
+    )
\ No newline at end of file
@@ -0,0 +1,149 @@
+"""
+pubmed_parse.py
+
+Hot-path parsing and formatting helpers for pubmed_meta_fetcher.
+
+These functions dominate the interpreter-bound CPU time once network I/O
+is batched, so they live in their own fully type-annotated module that
+can optionally be AOT-compiled with mypyc:
+
+    pip install mypy lxml-stubs
+    mypyc pubmed_parse.py
+
+The compiled extension shadows this file when present; otherwise this
+pure-Python module is used as-is, with no import changes needed.
+"""
+
+from typing import Any, Dict, List, cast
+
+from lxml import etree
+
+# Precompiled XPath accessors for <PubmedArticle> elements; compiling each
+# expression once avoids re-parsing the path string per article and field.
+_XP_PMID = etree.XPath("string(MedlineCitation/PMID)")
+_XP_TITLE = etree.XPath("string(MedlineCitation/Article/ArticleTitle)")
+_XP_JOURNAL = etree.XPath("string(MedlineCitation/Article/Journal/Title)")
+# Two separate year expressions: a single union-plus-[1] XPath would pick
+# by document order, and DateCreated precedes Article in the DTD, which
+# would invert the PubDate-first preference parse_article implements.
+_XP_PUBDATE_YEAR = etree.XPath(
+    "string(MedlineCitation/Article/Journal/JournalIssue/PubDate/Year)"
+)
+_XP_DATECREATED_YEAR = etree.XPath("string(MedlineCitation/DateCreated/Year)")
+_XP_AUTHORS = etree.XPath("MedlineCitation/Article/AuthorList/Author")
+
+def fmt_author(author: Dict[str, Any]) -> str:
+    """
+    Format one AuthorList entry as "ForeName LastName", falling back to
+    the collective name for group authors. Returns "" for empty entries.
+    """
+    name = f"{author.get('ForeName', '')} {author.get('LastName', '')}".strip()
+    return name or author.get("CollectiveName", "")
+
+def parse_article(article_data: Any, pmid: str = "") -> Dict[str, str]:
+    """
+    Parse a single PubmedArticle record (as returned by Entrez.read) into a
+    flat metadata dictionary.
+
+    :param article_data: One entry from records["PubmedArticle"].
+    :param pmid: The PubMed ID used for the request, as a fallback if the
+        record itself does not carry one.
+    :return: A dictionary with keys 'PubMed_ID', 'Title', 'Authors',
+        'Journal', and 'Year'; empty if the record has no MedlineCitation.
+    """
+    # Pull each intermediate mapping into a local exactly once rather than
+    # re-dispatching through chained .get() calls per field.
+    if (medline_citation := article_data.get("MedlineCitation")) is None:
+        return {}
+    article = medline_citation.get("Article", {})
+    journal_info = article.get("Journal", {})
+    journal_issue = journal_info.get("JournalIssue", {})
+
+    # PubMed ID (usually the same as the input, but we can confirm from the record)
+    record_pmid = medline_citation.get("PMID", pmid)
+
+    # Title
+    title = article.get("ArticleTitle", "")
+
+    # Journal
+    journal_title = journal_info.get("Title", "")
+
+    # Authors (join ForeName + LastName); a generator feeds str.join
+    # directly so no intermediate list is built per article.
+    authors_str = ", ".join(
+        filter(None, (fmt_author(author) for author in article.get("AuthorList", [])))
+    )
+
+    # Year (preferred from JournalIssue -> PubDate -> Year)
+    if not (year := journal_issue.get("PubDate", {}).get("Year", "")):
+        year = medline_citation.get("DateCreated", {}).get("Year", "")
+
+    return {
+        "PubMed_ID": str(record_pmid),
+        "Title": title,
+        "Authors": authors_str,
+        "Journal": journal_title,
+        "Year": year
+    }
+
+def parse_article_element(elem: etree._Element) -> Dict[str, str]:
+    """
+    Extract metadata from a single <PubmedArticle> lxml element.
+
+    Used by the streaming batch parser; the caller is responsible for
+    clearing the element afterwards to keep memory flat.
+
+    :param elem: An lxml element rooted at <PubmedArticle>.
+    :return: A dictionary with keys 'PubMed_ID', 'Title', 'Authors',
+        'Journal', and 'Year'.
+    """
+    # The string(...) expressions always evaluate to str; the casts narrow
+    # XPath's broad bool/float/str/list return union for mypy(c).
+    pmid = str(_XP_PMID(elem))
+    title = str(_XP_TITLE(elem))
+    journal_title = str(_XP_JOURNAL(elem))
+    # Year (preferred from JournalIssue -> PubDate -> Year)
+    year = str(_XP_PUBDATE_YEAR(elem)) or str(_XP_DATECREATED_YEAR(elem))
+
+    author_list = []
+    for author in cast(List[etree._Element], _XP_AUTHORS(elem)):
+        last_name = author.findtext("LastName") or ""
+        fore_name = author.findtext("ForeName") or ""
+        if last_name or fore_name:
+            author_list.append(f"{fore_name} {last_name}".strip())
+        else:
+            collective = author.findtext("CollectiveName")
+            if collective:
+                author_list.append(collective)
+    authors_str = ", ".join(author_list)
+
+    return {
+        "PubMed_ID": pmid,
+        "Title": title,
+        "Authors": authors_str,
+        "Journal": journal_title,
+        "Year": year
+    }
+
+def summary_to_row(pmid: str, doc: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Convert one ESummary JSON document into a flat metadata dictionary.
+
+    :param pmid: The PubMed ID the document was requested for.
+    :param doc: The per-PMID entry from the ESummary "result" object.
+    :return: A dictionary with keys 'PubMed_ID', 'Title', 'Authors',
+        'Journal', and 'Year'.
+    """
+    authors_str = ", ".join(
+        author.get("name", "") for author in doc.get("authors", []) if author.get("name")
+    )
+    # pubdate looks like "2020 Mar 15"; the year is the first token.
+    year = doc.get("pubdate", "").split(" ", 1)[0]
+
+    return {
+        "PubMed_ID": pmid,
+        "Title": doc.get("title", ""),
+        "Authors": authors_str,
+        "Journal": doc.get("fulljournalname", ""),
+        "Year": year
+    }